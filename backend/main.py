@@ -1,6 +1,9 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes import seo_router
+from models import Message
+from services import close_browser, close_client
 from config import (
     API_TITLE,
     API_DESCRIPTION,
@@ -11,10 +14,22 @@ from config import (
     CORS_HEADERS,
 )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release the shared headless browser and HTTP client on shutdown"""
+    yield
+    try:
+        await close_browser()
+    finally:
+        await close_client()
+
+
 app = FastAPI(
     title=API_TITLE,
     description=API_DESCRIPTION,
     version=API_VERSION,
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -30,7 +45,7 @@ app.add_middleware(
 app.include_router(seo_router)
 
 
-@app.get("/")
+@app.get("/", response_model=Message)
 async def root():
     """Root endpoint"""
     return {"message": "Welcome to Vibe Coding API"}
@@ -1,10 +1,18 @@
-from .scraper import extract_html_content
-from .ml_analyzer import analyze_content_ml
-from .cro_analyzer import generate_cro_recommendations, get_fallback_recommendations
+from .scraper import (
+    extract_html_content,
+    extract_html_content_batch,
+    close_browser,
+    ExtractedPage,
+    BatchResult,
+)
+from .http import get_client, close_client
 
 __all__ = [
     "extract_html_content",
-    "analyze_content_ml",
-    "generate_cro_recommendations",
-    "get_fallback_recommendations",
+    "extract_html_content_batch",
+    "close_browser",
+    "ExtractedPage",
+    "BatchResult",
+    "get_client",
+    "close_client",
 ]
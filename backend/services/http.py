@@ -0,0 +1,28 @@
+import httpx
+
+# Shared client so requests to the same host reuse pooled TCP/TLS connections
+_client = None
+
+_USER_AGENT = "Mozilla/5.0 (compatible; VibeCodingBot/1.0)"
+
+
+async def get_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            headers={"User-Agent": _USER_AGENT},
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            timeout=30,
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Close the shared HTTP client and its connection pool"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,70 +1,627 @@
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
-from bs4 import BeautifulSoup
+from playwright.async_api import (
+    async_playwright,
+    BrowserContext,
+    TimeoutError as PlaywrightTimeout,
+)
+from lxml import etree
 from fastapi import HTTPException
-import re
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from array import array
+from dataclasses import dataclass, fields
+from .http import get_client
+import asyncio
+import codecs
+import copy
+import httpx
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
+# Shared Playwright driver, browser and contexts (one per JavaScript setting),
+# created once and reused across calls; each render only opens a page
+_pw = None
+_browser = None
+_contexts: Dict[bool, BrowserContext] = {}
+_lock = asyncio.Lock()
+
+# Headless text extraction needs none of Chromium's GPU, extension or
+# background-service machinery
+_LAUNCH_ARGS = [
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--metrics-recording-only",
+    "--mute-audio",
+    "--no-first-run",
+]
+_VIEWPORT = {"width": 1280, "height": 800}
+
+_PARTIAL_WARNING = (
+    "[BROWSER_RECOMMENDED] Page load timed out; content may be incomplete"
+)
+
+# Pages open at once across all renders
+_MAX_PAGES = 8
+_page_slots = asyncio.Semaphore(_MAX_PAGES)
+
+# Subresources that never contribute to the extracted text
+_BLOCKED_RESOURCES = {"image", "font", "media", "stylesheet"}
+
+# Third-party analytics and ad hosts whose subresource requests are dropped;
+# each also matches its subdomains
+_BLOCKLIST = (
+    "googletagmanager.com",
+    "google-analytics.com",
+    "doubleclick.net",
+    "facebook.net",
+    "hotjar.com",
+    "hotjar.io",
+    "segment.io",
+)
+
+# Script bundles that indicate a client-rendered single-page app
+_SPA_BUNDLES = ("react", "next", "vue")
+
+_WS_RE = re.compile(r"\s+")
+
+# Characters of page text kept for downstream processing
+_TEXT_LIMIT = 5000
+
+# Statically fetched pages with less text than this are re-rendered in the browser
+_MIN_STATIC_TEXT = 500
+
+# Limits on the static fetch: total seconds and bytes of body read. httpx's own
+# timeout only applies per read, so a slow-dripping body would never time out
+_STATIC_TIMEOUT = 10
+_MAX_BODY = 5 * 1024 * 1024
+
+_HTML_TYPES = ("text/html", "application/xhtml+xml")
+
+# Leading bytes searched for a BOM or <meta charset> when the Content-Type
+# names no charset, as browsers do before decoding
+_SNIFF_BYTES = 1024
+_BOMS = (codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+_META_CHARSET_RE = re.compile(rb"<meta[^>]*?charset\s*=\s*[\"']?\s*([\w.:-]+)", re.I)
+
+# Per (url, render_js): ETag, Last-Modified and the extracted result, so an
+# unchanged page can be answered with a conditional GET instead of a re-scrape.
+# Only pages extracted without running JavaScript are cached: a rendered page
+# can change while its HTML shell, and so its validators, stay the same
+_CACHE: Dict[
+    Tuple[str, Optional[bool]], Tuple[Optional[str], Optional[str], "ExtractedPage"]
+] = {}
+_CACHE_MAX = 512
+
+
+async def _get_browser():
+    """Return the shared Chromium instance, relaunching it if it has gone away"""
+    global _pw, _browser
+    if _browser is None or not _browser.is_connected():
+        async with _lock:
+            if _browser is None or not _browser.is_connected():
+                # A crashed or killed browser takes its contexts down with it
+                _contexts.clear()
+                if _pw is None:
+                    _pw = await async_playwright().start()
+                _browser = await _pw.chromium.launch(headless=True, args=_LAUNCH_ARGS)
+    return _browser
+
+
+async def _get_context(javascript: bool) -> BrowserContext:
+    """Return the shared browser context for the JavaScript setting"""
+    browser = await _get_browser()
+    context = _contexts.get(javascript)
+    if context is None:
+        async with _lock:
+            context = _contexts.get(javascript)
+            if context is None:
+                context = await browser.new_context(
+                    viewport=_VIEWPORT, java_script_enabled=javascript
+                )
+                _contexts[javascript] = context
+    return context
+
+
+async def close_browser() -> None:
+    """Shut down the shared browser contexts, browser and Playwright driver"""
+    global _pw, _browser
+    async with _lock:
+        if _browser is not None and _browser.is_connected():
+            for context in _contexts.values():
+                await context.close()
+            await _browser.close()
+        _contexts.clear()
+        _browser = None
+        if _pw is not None:
+            await _pw.stop()
+            _pw = None
+
+
+@dataclass(slots=True)
+class ExtractedPage:
+    """Content and CRO signals extracted from a single page"""
+
+    title: str
+    text: str
+    h1_tags: List[str]
+    meta_description: Optional[str]
+    cta_texts: List[str]
+    has_forms: bool
+    content_length: int
+    partial: bool
+    warnings: List[str]
 
-async def extract_html_content(url: str) -> dict:
-    """Extract HTML content from URL using Playwright"""
+    def to_dict(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+@dataclass
+class BatchResult:
+    """Column-oriented batch results, one entry per input URL in input order
+
+    Numeric columns are ``array.array`` so they can be handed to columnar
+    tools without per-row conversion. Failed URLs get empty values and their
+    message in ``errors``.
+    """
+
+    urls: List[str]
+    titles: List[str]
+    texts: List[str]
+    h1_tags: List[List[str]]
+    meta_descriptions: List[Optional[str]]
+    cta_texts: List[List[str]]
+    has_forms: array
+    content_lengths: array
+    partial: array
+    warnings: List[List[str]]
+    errors: List[Optional[str]]
+
+
+async def extract_html_content(
+    url: str, render_js: Optional[bool] = None, isolate: bool = False
+) -> dict:
+    """Extract HTML content from URL, over plain HTTP or with Playwright
+
+    By default the page is fetched over HTTP and parsed while it downloads,
+    escalating to a Playwright render only when the static HTML looks
+    JS-gated. ``render_js=True`` always renders; ``render_js=False`` never does.
+    Renders share one browser context unless ``isolate`` asks for a fresh one,
+    e.g. for targets where cookies from earlier scrapes must not carry over.
+    """
+    page = await _extract(url, render_js, isolate)
+    return page.to_dict()
+
+
+async def extract_html_content_batch(
+    urls: List[str],
+    max_concurrency: int = 5,
+    render_js: Optional[bool] = None,
+    isolate: bool = False,
+) -> BatchResult:
+    """Extract HTML content from several URLs concurrently
+
+    A failed URL is recorded in ``errors`` instead of aborting the batch.
+    """
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def one(u: str) -> ExtractedPage:
+        async with sem:
+            return await _extract(u, render_js, isolate)
+
+    results = await asyncio.gather(*(one(u) for u in urls), return_exceptions=True)
+
+    pages = []
+    errors = []
+    for r in results:
+        if isinstance(r, BaseException):
+            pages.append(ExtractedPage("", "", [], None, [], False, 0, False, []))
+            errors.append(r.detail if isinstance(r, HTTPException) else str(r))
+        else:
+            pages.append(r)
+            errors.append(None)
+
+    return BatchResult(
+        urls=list(urls),
+        titles=[p.title for p in pages],
+        texts=[p.text for p in pages],
+        h1_tags=[p.h1_tags for p in pages],
+        meta_descriptions=[p.meta_description for p in pages],
+        cta_texts=[p.cta_texts for p in pages],
+        has_forms=array("b", [p.has_forms for p in pages]),
+        content_lengths=array("I", [p.content_length for p in pages]),
+        partial=array("b", [p.partial for p in pages]),
+        warnings=[p.warnings for p in pages],
+        errors=errors,
+    )
+
+
+async def _extract(url: str, render_js: Optional[bool], isolate: bool) -> ExtractedPage:
+    key = (url, render_js)
     try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page()
-
-            await page.goto(url, wait_until="networkidle", timeout=15000)
-            content = await page.content()
-            title = await page.title()
-
-            await browser.close()
-
-            # Parse HTML
-            soup = BeautifulSoup(content, "lxml")
-
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
-
-            # Extract text content
-            text = soup.get_text()
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = " ".join(chunk for chunk in chunks if chunk)
-
-            # Extract key elements
-            h1_tags = [h1.get_text().strip() for h1 in soup.find_all("h1")]
-            meta_desc = soup.find("meta", attrs={"name": "description"})
-            meta_description = (
-                meta_desc["content"] if meta_desc and meta_desc.get("content") else None
-            )
+        # An isolated scrape must not be answered from, or feed, a result
+        # scraped with state shared across calls
+        cached = None if isolate else _CACHE.get(key)
+        validators = _validators(cached) if cached is not None else None
+        scraped = await _scrape(url, render_js, isolate, validators)
+        if scraped is None:
+            return copy.deepcopy(cached[2])
 
-            # Check for CTAs
-            buttons = soup.find_all(
-                ["button", "a"], class_=re.compile(r"(btn|button|cta)", re.I)
-            )
-            cta_texts = [btn.get_text().strip() for btn in buttons[:5]]
-
-            # Check for forms
-            forms = soup.find_all("form")
-            has_forms = len(forms) > 0
-
-            return {
-                "title": title,
-                "text": text[:5000],  # Limit text for processing
-                "h1_tags": h1_tags,
-                "meta_description": meta_description,
-                "cta_texts": cta_texts,
-                "has_forms": has_forms,
-                "content_length": len(text),
-            }
-    except PlaywrightTimeout:
+        page, headers = scraped
+        if not isolate:
+            _remember(key, headers, page)
+        return page
+    except (PlaywrightTimeout, httpx.TimeoutException, asyncio.TimeoutError):
         raise HTTPException(
             status_code=408, detail="Request timeout while loading the page"
         )
     except Exception as e:
-        logger.error(f"Error extracting content: {e}")
+        logger.error("Error extracting content: %s", e)
         raise HTTPException(
             status_code=400, detail=f"Failed to extract content: {str(e)}"
         )
+
+
+def _validators(cached) -> Dict[str, str]:
+    """Conditional request headers revalidating a cached page"""
+    etag, last_modified, _ = cached
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def _remember(key: Tuple[str, Optional[bool]], headers, page: ExtractedPage) -> None:
+    """Cache the page if the response carried validators"""
+    _CACHE.pop(key, None)
+    etag = headers.get("etag")
+    last_modified = headers.get("last-modified")
+    if not etag and not last_modified:
+        return
+    if len(_CACHE) >= _CACHE_MAX:
+        del _CACHE[next(iter(_CACHE))]  # evict the oldest entry
+    _CACHE[key] = (etag, last_modified, copy.deepcopy(page))
+
+
+async def _scrape(
+    url: str,
+    render_js: Optional[bool],
+    isolate: bool,
+    validators: Optional[Dict[str, str]] = None,
+):
+    """Fetch and extract the page, returning it with the headers to cache it by
+
+    With ``validators`` the HTTP fetch is conditional, and None is returned
+    when the server answers 304 Not Modified.
+    """
+    if not render_js:
+        try:
+            fetched = await _stream_page(url, validators)
+        except httpx.HTTPError:
+            if render_js is False:
+                raise
+            # Blocked or failing for plain HTTP clients: let the browser fetch the
+            # HTML, still without running scripts, before paying for a full render
+            fetched = await _render_page(url, isolate, javascript=False)
+        if fetched is None:
+            return None
+
+        extractor, headers = fetched
+        page = extractor.result()
+        if render_js is False or not (extractor.spa_script or _looks_unrendered(page)):
+            return page, headers
+
+    extractor, _ = await _render_page(url, isolate)
+    # No validators, so the rendered result is never cached
+    return extractor.result(), {}
+
+
+def _looks_unrendered(page: ExtractedPage) -> bool:
+    """Whether statically fetched HTML is missing content a browser would render"""
+    return page.content_length < _MIN_STATIC_TEXT or not page.h1_tags
+
+
+async def _block_assets(route) -> None:
+    request = route.request
+    # The page being scraped may itself live on a blocklisted host
+    if request.is_navigation_request() and request.frame.parent_frame is None:
+        await route.continue_()
+    elif request.resource_type in _BLOCKED_RESOURCES or _blocked_host(request.url):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+def _blocked_host(url: str) -> bool:
+    host = urlsplit(url).hostname or ""
+    return any(host == b or host.endswith("." + b) for b in _BLOCKLIST)
+
+
+async def _render_page(url: str, isolate: bool = False, javascript: bool = True):
+    """Load the page in the shared browser and parse the rendered DOM
+
+    Without JavaScript the DOM is just the server's HTML, so the navigation
+    response body is parsed directly instead of serializing the page. If
+    navigation times out, whatever has rendered is returned marked partial.
+    """
+    async with _page_slots:
+        if isolate:
+            browser = await _get_browser()
+            context = await browser.new_context(
+                viewport=_VIEWPORT, java_script_enabled=javascript
+            )
+        else:
+            context = await _get_context(javascript)
+        page = None
+        try:
+            page = await context.new_page()
+            await page.route("**/*", _block_assets)
+
+            timed_out = None
+            try:
+                response = await page.goto(
+                    url, wait_until="domcontentloaded", timeout=10000
+                )
+            except PlaywrightTimeout as e:
+                # Keep whatever has loaded so far instead of failing the scrape
+                timed_out = e
+                response = None
+            headers = response.headers if response is not None else {}
+            if not javascript and response is not None:
+                content = await response.body()
+                encoding = _charset(headers.get("content-type", ""))
+            else:
+                if javascript and timed_out is None:
+                    try:
+                        # Best effort: give late content a moment, but accept a
+                        # partial load
+                        await page.wait_for_load_state("load", timeout=3000)
+                    except PlaywrightTimeout:
+                        pass
+                try:
+                    # The serialized DOM is already decoded, so any <meta charset>
+                    # in it is stale
+                    content = (await page.content()).encode("utf-8")
+                except Exception:
+                    if timed_out is None:
+                        raise
+                    raise timed_out
+                encoding = "utf-8"
+        finally:
+            if isolate:
+                await context.close()
+            elif page is not None:
+                await page.close()
+
+    # Parsing a whole rendered page is CPU-bound; keep it off the event loop
+    extractor = await asyncio.to_thread(_parse, content, encoding)
+    if timed_out is not None:
+        if extractor.is_empty():
+            raise timed_out
+        extractor.partial = True
+        extractor.warnings.append(_PARTIAL_WARNING)
+    return extractor, headers
+
+
+def _charset(content_type: str) -> Optional[str]:
+    """Return the charset parameter of a Content-Type header, if any"""
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset":
+            return value.strip().strip("\"'") or None
+    return None
+
+
+async def _stream_page(url: str, validators: Optional[Dict[str, str]] = None):
+    """Fetch the raw HTML over HTTP, feeding the parser as chunks arrive
+
+    The whole fetch is bounded by ``_STATIC_TIMEOUT`` and only the first
+    ``_MAX_BODY`` bytes of the body are parsed. Returns None if a conditional
+    fetch finds the page unchanged.
+    """
+    return await asyncio.wait_for(_fetch_and_parse(url, validators), _STATIC_TIMEOUT)
+
+
+async def _fetch_and_parse(url: str, validators: Optional[Dict[str, str]]):
+    client = await get_client()
+    extractor = _PageExtractor()
+    async with client.stream("GET", url, headers=validators) as response:
+        if validators and response.status_code == 304:
+            return None
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "")
+        media_type = content_type.split(";")[0].strip().lower()
+        if media_type and media_type not in _HTML_TYPES:
+            raise ValueError(f"Unsupported content type: {media_type}")
+
+        charset = response.charset_encoding
+        parser = None
+        head = b""
+        received = 0
+        async for chunk in response.aiter_bytes():
+            chunk = chunk[: _MAX_BODY - received]
+            received += len(chunk)
+            if parser is None:
+                # Hold back the start of the body until the charset is known
+                head += chunk
+                if len(head) < _SNIFF_BYTES and received < _MAX_BODY:
+                    continue
+                parser = _parser(extractor, _encoding(charset, head))
+                chunk = head
+            parser.feed(chunk)
+            if received >= _MAX_BODY:
+                break
+    if parser is None:
+        parser = _parser(extractor, _encoding(charset, head))
+        parser.feed(head)
+    # An empty body is a JS-gated signal, not an error: libxml2 refuses to close
+    # a parser that was never fed, so give it an empty document
+    parser.feed(b"")
+    parser.close()
+    return extractor, response.headers
+
+
+def _parse(content: bytes, encoding: Optional[str] = None) -> "_PageExtractor":
+    """Run a fully downloaded document through the extractor"""
+    extractor = _PageExtractor()
+    parser = _parser(extractor, _encoding(encoding, content))
+    parser.feed(content)
+    parser.close()
+    return extractor
+
+
+def _encoding(declared: Optional[str], head: bytes) -> Optional[str]:
+    """Pick the charset to parse with; None leaves detection to libxml2
+
+    A Content-Type charset wins, then a BOM or ``<meta charset>`` near the
+    start. Undeclared documents are read as UTF-8 rather than libxml2's
+    Latin-1 default, and ASCII labels are widened to UTF-8 since libxml2 drops
+    the whole document on a single byte outside ASCII.
+    """
+    if declared is not None and _codec(declared) is None:
+        declared = None  # unknown label, decide as if none was sent
+    if declared is None:
+        if head.startswith(_BOMS):
+            return None
+        match = _META_CHARSET_RE.search(head[:_SNIFF_BYTES])
+        if match is None:
+            return "utf-8"
+        declared = match.group(1).decode("ascii")
+    return "utf-8" if _codec(declared) == "ascii" else declared
+
+
+def _codec(label: str) -> Optional[str]:
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+
+def _parser(extractor: "_PageExtractor", encoding: Optional[str]) -> etree.HTMLParser:
+    try:
+        return etree.HTMLParser(target=extractor, encoding=encoding)
+    except LookupError:
+        # Charset libxml2 doesn't know; fall back to sniffing the document
+        return etree.HTMLParser(target=extractor)
+
+
+class _PageExtractor:
+    """lxml parser target that collects everything the scraper needs in one pass
+
+    No tree is built: text outside script/style goes into a capped, whitespace
+    normalized buffer, and the title, h1s, meta description, first five CTAs
+    and form presence are picked up from the start/end/data events.
+    """
+
+    def __init__(self):
+        self.title = None
+        self.h1_tags = []
+        self.meta_description = None
+        self.cta_texts = []
+        self.has_forms = False
+        self.spa_script = False
+        self.partial = False
+        self.warnings = []
+
+        self._text_parts = []
+        self._length = 0
+        self._prev_space = True  # drops leading whitespace
+        self._skip = 0  # depth inside script/style
+        self._in_title = False
+        self._title_parts = []
+        # One entry per open element: the capture key for h1s/CTAs, else None
+        self._stack = []
+        self._captures = {}  # key -> (result list, slot, text parts so far)
+
+    def start(self, tag, attrib):
+        key = None
+        if tag in ("script", "style"):
+            self._skip += 1
+            src = attrib.get("src")
+            if src and any(bundle in src for bundle in _SPA_BUNDLES):
+                self.spa_script = True
+        elif tag == "title":
+            self._in_title = self.title is None
+        elif tag == "h1":
+            key = self._open(self.h1_tags)
+        elif tag in ("button", "a"):
+            if len(self.cta_texts) < 5:
+                cls = attrib.get("class", "").lower()
+                if "btn" in cls or "button" in cls or "cta" in cls:
+                    key = self._open(self.cta_texts)
+        elif tag == "meta":
+            if (
+                self.meta_description is None
+                and attrib.get("name") == "description"
+                and "content" in attrib
+            ):
+                self.meta_description = attrib["content"]
+        elif tag == "form":
+            self.has_forms = True
+        self._stack.append(key)
+
+    def end(self, tag):
+        if tag in ("script", "style"):
+            self._skip -= 1
+        elif tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = " ".join("".join(self._title_parts).split())
+        key = self._stack.pop() if self._stack else None
+        if key is not None:
+            target, slot, parts = self._captures.pop(key)
+            target[slot] = "".join(parts).strip()
+
+    def data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+        if self._skip:
+            return
+        for _, _, parts in self._captures.values():
+            parts.append(data)
+
+        norm = _WS_RE.sub(" ", data)
+        if self._prev_space and norm[:1] == " ":
+            norm = norm[1:]
+        if not norm:
+            return
+        if self._length < _TEXT_LIMIT:
+            self._text_parts.append(norm)
+        self._length += len(norm)
+        self._prev_space = norm[-1] == " "
+
+    def close(self):
+        pass
+
+    def _open(self, target: list):
+        """Reserve the next slot in target, in start-tag order, and start capturing"""
+        slot = len(target)
+        target.append("")
+        key = (id(target), slot)
+        self._captures[key] = (target, slot, [])
+        return key
+
+    def is_empty(self) -> bool:
+        """Whether the document had no visible text at all"""
+        return not self._length
+
+    def result(self) -> ExtractedPage:
+        length = self._length
+        if self._prev_space and length:
+            length -= 1  # trailing whitespace
+        return ExtractedPage(
+            title=self.title or "",
+            text="".join(self._text_parts)[: min(length, _TEXT_LIMIT)],
+            h1_tags=self.h1_tags,
+            meta_description=self.meta_description or None,
+            cta_texts=self.cta_texts,
+            has_forms=self.has_forms,
+            content_length=length,
+            partial=self.partial,
+            warnings=self.warnings,
+        )
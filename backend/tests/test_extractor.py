@@ -0,0 +1,143 @@
+import random
+
+import pytest
+
+from services.scraper import _PageExtractor, _parse, _parser
+
+SAMPLE = b"""<html><head>
+<title>  Acme
+   Pricing </title>
+<meta name="description" content="Plans for teams">
+<style>body { color: red }</style>
+</head><body>
+<h1> Simple   pricing </h1>
+<p>Start  free,\n upgrade   later.</p>
+<a class="btn btn-primary" href="/signup">Sign <b>up</b></a>
+<button class="Hero-CTA">Talk to sales</button>
+<a href="/docs">Docs</a>
+<script>document.write("<h1>injected</h1>")</script>
+<form><input name="email"></form>
+</body></html>"""
+
+
+def _feed_in_chunks(content: bytes, sizes) -> _PageExtractor:
+    extractor = _PageExtractor()
+    parser = _parser(extractor, None)
+    pos = 0
+    for size in sizes:
+        parser.feed(content[pos : pos + size])
+        pos += size
+    parser.feed(content[pos:])
+    parser.close()
+    return extractor
+
+
+def test_sample_page():
+    page = _parse(SAMPLE).result()
+    assert page.title == "Acme Pricing"
+    assert page.text == (
+        "Acme Pricing Simple pricing Start free, upgrade later. "
+        "Sign up Talk to sales Docs"
+    )
+    assert page.h1_tags == ["Simple   pricing"]
+    assert page.meta_description == "Plans for teams"
+    assert page.cta_texts == ["Sign up", "Talk to sales"]
+    assert page.has_forms is True
+    assert page.content_length == len(page.text)
+    assert page.partial is False and page.warnings == []
+
+
+def test_empty_document():
+    extractor = _parse(b"")
+    assert extractor.is_empty()
+    page = extractor.result()
+    assert (page.title, page.text, page.content_length) == ("", "", 0)
+    assert page.meta_description is None
+
+
+def test_malformed_nesting():
+    page = _parse(
+        b"<body><h1>Hello <b>big world</h1> after</b>"
+        b"<p>one<div>two</p>three</div></body>"
+    ).result()
+    assert page.h1_tags == ["Hello big world"]
+    assert page.text == "Hello big world afteronetwothree"
+    assert page.content_length == 32
+
+
+def test_script_and_style_are_skipped():
+    extractor = _parse(
+        b"<head><style>p { margin: 0 }</style>"
+        b"<script src='/static/react.production.min.js'></script></head>"
+        b"<body><script>var s = '<h1>no</h1>'</script><p>Visible</p></body>"
+    )
+    page = extractor.result()
+    assert page.text == "Visible"
+    assert page.h1_tags == []
+    assert extractor.spa_script is True
+
+
+def test_first_title_and_description_win():
+    page = _parse(
+        b"<head><title>First</title><title>Second</title>"
+        b"<meta name='description' content='one'>"
+        b"<meta name='description' content='two'></head>"
+    ).result()
+    assert page.title == "First"
+    assert page.meta_description == "one"
+
+
+def test_cta_cap():
+    links = b"".join(b"<a class='Btn-primary'>Go %d</a>" % i for i in range(7))
+    page = _parse(
+        b"<body>" + links + b"<button class='other'>x</button></body>"
+    ).result()
+    assert page.cta_texts == ["Go 0", "Go 1", "Go 2", "Go 3", "Go 4"]
+
+
+def test_nested_captures():
+    page = _parse(
+        b"<body><h1>Top <a class='cta'>Buy <b>now</b></a></h1></body>"
+    ).result()
+    assert page.h1_tags == ["Top Buy now"]
+    assert page.cta_texts == ["Buy now"]
+
+
+@pytest.mark.parametrize("n", [4999, 5000, 5001, 6000])
+def test_text_limit(n):
+    page = _parse(b"<p>" + b"x" * n + b"</p>  ").result()
+    assert page.text == "x" * min(n, 5000)
+    assert page.content_length == n
+
+
+def test_text_limit_with_whitespace():
+    page = _parse(b"<p>" + b"ab \n" * 3000 + b"</p>").result()
+    assert page.text == ("ab " * 1667)[:5000]
+    assert page.content_length == 3 * 3000 - 1  # trailing space dropped
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_chunked_feed_matches_whole(seed):
+    rng = random.Random(seed)
+    content = SAMPLE + b"<p>" + b"filler  text\n" * 500 + b"</p>"
+    sizes = [rng.randint(1, 64) for _ in range(rng.randint(1, 200))]
+    assert _feed_in_chunks(content, sizes).result() == _parse(content).result()
+
+
+@pytest.mark.parametrize(
+    "content, encoding",
+    [
+        ("<h1>café</h1>".encode(), None),
+        ("<h1>café</h1>".encode(), "us-ascii"),
+        ("<h1>café</h1>".encode(), "x-unknown"),
+        ("<meta charset='ascii'><h1>café</h1>".encode(), None),
+        ("<meta charset=latin-1><h1>café</h1>".encode("latin-1"), None),
+        ("﻿<h1>café</h1>".encode("utf-16-le"), None),
+        ("<h1>café</h1>".encode("cp1252"), "windows-1252"),
+    ],
+    ids=["undeclared", "ascii", "unknown", "meta-ascii", "meta", "bom", "header"],
+)
+def test_charset(content, encoding):
+    page = _parse(content, encoding).result()
+    assert page.h1_tags == ["café"]
+    assert page.content_length == 4
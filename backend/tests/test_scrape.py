@@ -0,0 +1,270 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from services import http, scraper
+from services.scraper import _parse, extract_html_content
+
+FILLER = "<p>" + "Plenty of server-rendered copy. " * 30 + "</p>"
+
+
+def _page(heading: str) -> bytes:
+    return f"<html><body><h1>{heading}</h1>{FILLER}</body></html>".encode()
+
+
+@pytest.fixture
+def site(monkeypatch):
+    """Serve responses from a handler through the shared client; stub renders"""
+    requests = []
+    renders = []
+    routes = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return routes[request.url.path](request)
+
+    async def render_page(url, isolate=False, javascript=True):
+        renders.append(javascript)
+        return _parse(b"<h1>Rendered</h1>"), {"etag": '"shell"'}
+
+    monkeypatch.setattr(
+        http, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    monkeypatch.setattr(scraper, "_render_page", render_page)
+    monkeypatch.setattr(scraper, "_CACHE", {})
+
+    return SimpleNamespace(routes=routes, requests=requests, renders=renders)
+
+
+def _html(body: bytes, **headers) -> httpx.Response:
+    headers.setdefault("content-type", "text/html; charset=utf-8")
+    return httpx.Response(200, content=body, headers=headers)
+
+
+def _extract(url: str = "http://example.com/", **kwargs) -> dict:
+    return asyncio.run(extract_html_content(url, **kwargs))
+
+
+def test_cache_hit_on_304(site):
+    def route(request):
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return _html(_page("Original"), etag='"v1"')
+
+    site.routes["/"] = route
+    first = _extract(render_js=False)
+    second = _extract(render_js=False)
+    assert second == first
+    assert second["h1_tags"] == ["Original"]
+    assert len(site.requests) == 2
+
+
+def test_cache_miss_on_200_is_fetched_once(site):
+    versions = iter([("Original", '"v1"'), ("Updated", '"v2"')])
+
+    def route(request):
+        heading, etag = next(versions)
+        return _html(_page(heading), etag=etag, **{"last-modified": "Mon"})
+
+    site.routes["/"] = route
+    _extract(render_js=False)
+    updated = _extract(render_js=False)
+    assert updated["h1_tags"] == ["Updated"]
+    assert len(site.requests) == 2  # the conditional GET's body is used
+    assert site.requests[1].headers["if-none-match"] == '"v1"'
+    assert site.requests[1].headers["if-modified-since"] == "Mon"
+    assert scraper._CACHE[("http://example.com/", False)][0] == '"v2"'
+
+
+def test_no_validators_not_cached(site):
+    site.routes["/"] = lambda request: _html(_page("Plain"))
+    _extract(render_js=False)
+    _extract(render_js=False)
+    assert "if-none-match" not in site.requests[1].headers
+    assert scraper._CACHE == {}
+
+
+def test_callers_cannot_mutate_cached_page(site):
+    def route(request):
+        if request.headers.get("if-none-match"):
+            return httpx.Response(304)
+        return _html(_page("Original"), etag='"v1"')
+
+    site.routes["/"] = route
+    for _ in range(3):
+        result = _extract(render_js=False)
+        assert result["h1_tags"] == ["Original"]
+        result["h1_tags"].append("mutated")
+        result["warnings"].append("mutated")
+
+
+def test_rendered_pages_not_cached(site):
+    site.routes["/"] = lambda request: _html(b"<p>shell</p>", etag='"shell"')
+    assert _extract()["h1_tags"] == ["Rendered"]
+    assert _extract(render_js=True)["h1_tags"] == ["Rendered"]
+    assert site.renders == [True, True]
+    assert scraper._CACHE == {}
+
+
+def test_static_page_is_not_rendered(site):
+    site.routes["/"] = lambda request: _html(_page("Static"))
+    assert _extract()["h1_tags"] == ["Static"]
+    assert site.renders == []
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        _page("Short").replace(FILLER.encode(), b"<p>Loading...</p>"),
+        _page("").replace(b"<h1></h1>", b""),
+        _page("App").replace(b"<body>", b'<body><script src="/_next/app.js"></script>'),
+        b"",
+    ],
+    ids=["short", "no-h1", "spa-bundle", "empty"],
+)
+def test_unrendered_page_escalates(site, body):
+    site.routes["/"] = lambda request: _html(body)
+    assert _extract()["h1_tags"] == ["Rendered"]
+    assert site.renders == [True]
+
+
+def test_unrendered_page_kept_without_js(site):
+    site.routes["/"] = lambda request: _html(b"<h1>Short</h1>")
+    assert _extract(render_js=False)["h1_tags"] == ["Short"]
+    assert site.renders == []
+
+
+def test_status_error_falls_back_to_browser(site):
+    site.routes["/"] = lambda request: httpx.Response(403)
+    assert _extract()["h1_tags"] == ["Rendered"]
+    # The browser first fetches the HTML without scripts; the short result
+    # then escalates to a full render
+    assert site.renders == [False, True]
+
+
+def test_status_error_raises_without_js(site):
+    site.routes["/"] = lambda request: httpx.Response(404)
+    with pytest.raises(HTTPException) as exc:
+        _extract(render_js=False)
+    assert exc.value.status_code == 400
+    assert site.renders == []
+
+
+def test_non_html_rejected(site):
+    site.routes["/"] = lambda request: httpx.Response(
+        200, content=b"%PDF-1.7", headers={"content-type": "application/pdf"}
+    )
+    with pytest.raises(HTTPException) as exc:
+        _extract()
+    assert exc.value.status_code == 400
+    assert "application/pdf" in exc.value.detail
+    assert site.renders == []
+
+
+def test_missing_content_type_parsed(site):
+    site.routes["/"] = lambda request: httpx.Response(200, content=_page("Untyped"))
+    assert _extract()["h1_tags"] == ["Untyped"]
+
+
+def test_body_cap(site, monkeypatch):
+    monkeypatch.setattr(scraper, "_MAX_BODY", 64)
+    pulled = []
+
+    async def body():
+        for chunk in (b"<h1>Kept</h1>" + b"x" * 40, b"y" * 40, b"<h1>Cut</h1>"):
+            pulled.append(chunk)
+            yield chunk
+
+    site.routes["/"] = lambda request: httpx.Response(
+        200, content=body(), headers={"content-type": "text/html"}
+    )
+    result = _extract(render_js=False)
+    assert result["h1_tags"] == ["Kept"]
+    assert result["content_length"] == 64 - len("<h1></h1>")
+    assert len(pulled) == 2  # reading stops once the cap is reached
+
+
+def test_static_deadline(site, monkeypatch):
+    monkeypatch.setattr(scraper, "_STATIC_TIMEOUT", 0.2)
+
+    async def drip():
+        while True:
+            yield b"a"
+            await asyncio.sleep(0.05)
+
+    site.routes["/"] = lambda request: httpx.Response(
+        200, content=drip(), headers={"content-type": "text/html"}
+    )
+    with pytest.raises(HTTPException) as exc:
+        _extract(render_js=False)
+    assert exc.value.status_code == 408
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://hotjar.com/",
+        "https://static.hotjar.com/c/hotjar-123.js",
+        "https://www.googletagmanager.com/gtm.js?id=GTM-1",
+        "https://td.doubleclick.net/pixel",
+        "https://CDN.Segment.IO/analytics.js",
+    ],
+)
+def test_blocked_host(url):
+    assert scraper._blocked_host(url)
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://example.com/blog/leaving-hotjar",
+        "https://example.com/?ref=googletagmanager.com",
+        "https://notdoubleclick.net/ad.js",
+        "https://hotjar.com.example.org/",
+        "https://example.com/",
+        "data:text/plain,hotjar.com",
+    ],
+)
+def test_unblocked_host(url):
+    assert not scraper._blocked_host(url)
+
+
+@pytest.mark.parametrize("content_type", ["text/html", "text/html; charset=us-ascii"])
+def test_undeclared_or_ascii_charset_read_as_utf8(site, content_type):
+    site.routes["/"] = lambda request: _html(
+        _page("Café"), **{"content-type": content_type}
+    )
+    result = _extract()
+    assert result["h1_tags"] == ["Café"]
+    assert result["content_length"] > 500
+    assert site.renders == []
+
+
+def test_meta_charset_split_across_chunks(site):
+    async def body():
+        yield b"<html><head>"
+        yield b"<meta charset=windows-1252>"
+        yield "</head><body><h1>Caf\xe9</h1></body></html>".encode("cp1252")
+
+    site.routes["/"] = lambda request: httpx.Response(
+        200, content=body(), headers={"content-type": "text/html"}
+    )
+    assert _extract(render_js=False)["h1_tags"] == ["Café"]
+
+
+def test_isolated_scrape_bypasses_cache(site):
+    def route(request):
+        if request.headers.get("if-none-match"):
+            return httpx.Response(304)
+        return _html(_page("Fresh"), etag='"v1"')
+
+    site.routes["/"] = route
+    _extract(isolate=True)
+    assert scraper._CACHE == {}
+
+    _extract()
+    assert _extract(isolate=True)["h1_tags"] == ["Fresh"]
+    assert "if-none-match" not in site.requests[-1].headers